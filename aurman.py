@@ -19,14 +19,20 @@
 from __future__ import annotations
 
 import argparse
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from itertools import accumulate
+import heapq
 import logging
-from os import path, unlink
-from packaging import version
-import requests
-from simple_term_menu import TerminalMenu
+from operator import attrgetter
+from os import path, remove, replace, stat, utime
+import shutil
 import sys
 import subprocess
+from typing import Iterable
+import zlib
 
 from lib.util import AURManException, __version__
 from lib import aur, pacman, util, gpg
@@ -37,10 +43,33 @@ settings: Settings = Settings()
 
 
 logging.basicConfig(filename=settings.log_path, level=logging.DEBUG)
+aur.init_cache(f"{settings.aurman_path}/rpc-cache.sqlite", settings.cache_ttl)
+
+clone_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=settings.clone_jobs)
+clones: dict[str, Future] = {}
+
+# Packages installed (or confirmed up to date) by this run, so shared dependencies are only handled once
+installed_this_session: set[str] = set()
+
+# AUR packages which were not installed before this run, to tell new build dependencies apart from updated ones
+new_this_session: set[str] = set()
+
+
+# How many search results are offered when selecting a package
+MENU_SIZE = 30
+
+PACKAGE_TEMPLATE = ("  Package: %s\n"
+                    "  Description: %s\n"
+                    "  Version: %s\n"
+                    "  Maintainer: %s\n"
+                    "  Dependencies: %s")
 
 
 @dataclass(eq=True)
 class Package:
+    __slots__ = ('id', 'name', 'description', 'version', 'maintainer', 'base_package', 'dependencies', 'make_dependencies',
+                 'opt_dependencies', 'check_dependencies', 'aur_dependencies', 'popularity')
+
     id: int
     name: str
     description: str
@@ -54,7 +83,7 @@ class Package:
     aur_dependencies: list[Package]
     popularity: float
 
-    def __init__(self, pkginfo, parse_dependencies: bool = True) -> None:
+    def __init__(self, pkginfo) -> None:
         if not 'Depends' in pkginfo:
             pkginfo['Depends'] = []
 
@@ -80,36 +109,67 @@ class Package:
         self.check_dependencies = pkginfo['CheckDepends']
         self.aur_dependencies = []
 
-        if parse_dependencies:
-            aur_deps: list[str] = []
-            for pkg in self.dependencies + self.make_dependencies + self.check_dependencies:
-                pkg = util.remove_version_constraint(pkg)
-                if pacman.search_pacman(pkg):
-                    continue
-
-                aur_deps.append(pkg)
+    def __repr__(self) -> str:
+        return PACKAGE_TEMPLATE % (self.name, self.description, self.version, self.maintainer, ', '.join(
+            [util.color_text(f"{x}", util.color_from_version(x)) for x in self.dependencies] +
+            [util.color_text(f"{x} (make)", util.color_from_version(x)) for x in self.make_dependencies] +
+            [util.color_text(f"{x} (check)", util.color_from_version(x)) for x in self.check_dependencies]) or 'None')
+
+    def resolve_deps(self, packages: dict[str, Package]) -> None:
+        '''
+        Link the AUR dependencies of the package, taken from already built packages (names not in packages are not from AUR).
+        '''
+        deps = map(util.remove_version_constraint, self.dependencies + self.make_dependencies + self.check_dependencies)
+        self.aur_dependencies = [packages[p] for p in dict.fromkeys(deps) if p in packages and p != self.name]
 
-            if aur_deps:
-                self.aur_dependencies += [Package(p) for p in aur.get_aur_package_info(aur_deps) if p]
+    def get_aur_deps(self) -> list[Package]:
+        '''
+        Get all AUR dependencies of the package (including the dependencies of the dependencies), without duplicates.
+
+        Dependencies are sorted in install order: every package comes after its own dependencies.
+        '''
+        visited: set[str] = set()
+        visiting: set[str] = {self.name}
+        deps: list[Package] = []
+        stack: list[tuple[Package, bool]] = [(p, False) for p in reversed(self.aur_dependencies)]
+        while stack:
+            package, expanded = stack.pop()
+            if expanded:
+                # All dependencies of the package were added, so it can be installed now
+                visiting.remove(package.name)
+                visited.add(package.name)
+                deps.append(package)
+                continue
+
+            if package.name in visited:
+                continue
+
+            if package.name in visiting:
+                logging.warning(f"Dependency cycle detected on {package.name}, skipping it.")
+                continue
+
+            visiting.add(package.name)
+            stack.append((package, True))
+            stack.extend((p, False) for p in reversed(package.aur_dependencies))
+
+        return deps
 
-    def __repr__(self) -> str:
-        return (f"  Package: {self.name}\n" +
-                f"  Description: {self.description}\n" +
-                f"  Version: {self.version}\n" +
-                f"  Maintainer: {self.maintainer}\n" +
-                "  Dependencies: " + ', '.join(
-                    [util.color_text(f"{x}", util.color_from_version(x)) for x in self.dependencies] +
-                    [util.color_text(f"{x} (make)", util.color_from_version(x)) for x in self.make_dependencies] +
-                    [util.color_text(f"{x} (check)", util.color_from_version(x)) for x in self.check_dependencies]) or 'None')
 
-    def __gt__(self, other: Package) -> bool:
-        return self.popularity > other.popularity
+@dataclass(eq=True)
+class SearchResult:
+    __slots__ = ('id', 'name', 'description', 'version', 'maintainer', 'popularity')
 
-    def get_aur_deps(self) -> list[Package]:
-        return [p for p in (self.aur_dependencies + [x.get_aur_deps() for x in self.aur_dependencies]) if p]
+    id: int
+    name: str
+    description: str
+    version: str
+    maintainer: str
+    popularity: float
 
+    @classmethod
+    def from_json(cls, pkginfo: dict) -> SearchResult:
+        return cls(pkginfo['ID'], pkginfo['Name'], pkginfo['Description'], pkginfo['Version'], pkginfo['Maintainer'], pkginfo['Popularity'])
 
-class SearchResult(Package):
     def __repr__(self) -> str:
         return (f"  ID: {self.id}\n" +
                 f"  Package: {self.name}\n" +
@@ -119,193 +179,518 @@ class SearchResult(Package):
                 f"  Popularity: {self.popularity}")
 
 
-def search_package(q: str, select: bool = False) -> str:
+def fetch_search(q: str) -> list[SearchResult]:
     '''
     Searches for a package.
+
+    Package names are searched in the package cache first, and only their info is requested.
+    Falls back to the AUR search when the cache is missing or old, has no match or too many for one request.
     '''
-    res = requests.get(f"https://aur.archlinux.org/rpc?v=5&type=search&arg={q}")
-    if res.status_code != 200:
-        raise AURManException('Could not connect to AUR.')
+    if (names := aur.local_search(q, settings.aurman_path)) and len(names) <= aur.STEP:
+        pkginfos = aur.get_aur_package_info(names)
+    else:
+        pkginfos = aur.search_aur_packages(q)
 
-    result = res.json()
-    if not result['resultcount']:
+    if not pkginfos:
         raise AURManException(f"Package {q} not found.")
 
-    results: list[Package] = [SearchResult(x, False) for x in result['results']]
-    results.sort(reverse=True)
+    return [SearchResult.from_json(x) for x in pkginfos]
+
+
+def show_search_results(q: str, results: list[SearchResult]) -> None:
+    '''
+    Print the results of a search, sorted by popularity.
+    '''
+    results.sort(key=attrgetter('popularity'), reverse=True)
+    util.info(f"Search results for {q}: ")
+    sys.stdout.write(''.join(f"{package!r}\n\n" for package in results))
+
+
+def search_package(q: str, select: bool = False) -> str:
+    '''
+    Searches for a package.
+    '''
+    results = fetch_search(q)
 
     if select:
-        return results[TerminalMenu(map(lambda x: f"{x.name}: {x.description}", results)).show()].name
+        from simple_term_menu import TerminalMenu
+
+        # Only the most popular results are offered, no need to sort all of them
+        results = heapq.nlargest(MENU_SIZE, results, key=attrgetter('popularity'))
+        return results[TerminalMenu(f"{x.name}: {x.description}" for x in results).show()].name
     else:
-        util.info(f"Search results for {q}: ")
-        for package in results:
-            print(package)
-            print()
+        show_search_results(q, results)
 
     return ''
 
 
-def install_packages(pkg: str, show_pkgbuild: bool = False, dependency: bool = False) -> bool:
+def search_many(queries: list[str]) -> bool:
+    '''
+    Searches for packages, running all searches at the same time.
+    '''
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for q, results in zip(queries, executor.map(fetch_search, queries)):
+            show_search_results(q, results)
+
+    return True
+
+
+def fetch_dependency_tree(pkginfo: dict) -> dict[str, dict]:
+    '''
+    Fetch the info of a package and all of its AUR dependencies, one batched request per tree level.
+    '''
+    repo_packages = pacman.repo_packages_cache()
+    pkginfos: dict[str, dict] = {pkginfo['Name']: pkginfo}
+    seen: set[str] = {pkginfo['Name']}
+    level: list[dict] = [pkginfo]
+    while level:
+        names: list[str] = []
+        for info in level:
+            for pkg in map(util.remove_version_constraint, info.get('Depends', []) + info.get('MakeDepends', []) + info.get('CheckDepends', [])):
+                if not pkg or pkg in seen or pkg in repo_packages:
+                    continue
+
+                seen.add(pkg)
+                names.append(pkg)
+
+        level = aur.get_aur_package_info(names) if names else []
+        pkginfos.update({p['Name']: p for p in level})
+
+    return pkginfos
+
+
+def build_package_graph(pkginfo: dict, pkginfos: dict[str, dict]) -> Package:
+    '''
+    Build a package and its whole AUR dependency graph, creating each package only once.
+
+    pkginfos holds the info of the dependency tree (see fetch_dependency_tree).
+    '''
+    packages: dict[str, Package] = {name: Package(info) for name, info in pkginfos.items()}
+    for package in packages.values():
+        package.resolve_deps(packages)
+
+    return packages[pkginfo['Name']]
+
+
+def clone_package(name: str, base_package: str, quiet: bool = False) -> bool:
+    '''
+    Clone the git repository of a package.
+    '''
+    PKG_PATH = f"{settings.aurman_path}/{name}"
+
+    shutil.rmtree(PKG_PATH, ignore_errors=True)
+    procout = subprocess.run(['git', '-c', 'advice.detachedHead=false', 'clone', '--depth=1', '--single-branch', '--no-tags',
+                              f"https://aur.archlinux.org/{base_package}.git", PKG_PATH],
+                             stdout=subprocess.DEVNULL if quiet else None, stderr=subprocess.DEVNULL if quiet else None)
+    return procout.returncode == 0
+
+
+def prefetch_packages(pkginfos: list[dict]) -> None:
+    '''
+    Clone packages in background.
+    '''
+    for pkginfo in pkginfos:
+        if pkginfo['Name'] not in clones:
+            clones[pkginfo['Name']] = clone_pool.submit(clone_package, pkginfo['Name'], pkginfo['PackageBase'], True)
+
+
+def cancel_prefetch(names: Iterable[str]) -> None:
+    '''
+    Cancel the background clones of packages which have not started yet.
+    '''
+    for name in names:
+        if (future := clones.get(name)) and future.cancel():
+            del clones[name]
+
+
+def discard_prefetch() -> None:
+    '''
+    Cancel all pending background clones and remove the clones which are not going to be built.
+    '''
+    cancel_prefetch(list(clones))
+    wait(clones.values())
+    for name in clones:
+        shutil.rmtree(f"{settings.aurman_path}/{name}", ignore_errors=True)
+
+    clones.clear()
+
+
+def fetch_source(package: Package) -> bool:
+    '''
+    Get the git repository of a package, waiting for the background clone if there is one.
+    '''
+    if (future := clones.pop(package.name, None)) and future.result():
+        return True
+
+    return clone_package(package.name, package.base_package)
+
+
+def build_source(package: Package, show_pkgbuild: bool = False, dependency: bool = False, force: bool = False) -> bool:
+    '''
+    Build and install a cloned package, then remove its build files.
+    '''
+    PKG_PATH = f"{settings.aurman_path}/{package.name}"
+
+    if show_pkgbuild:
+        procout = subprocess.run(['less', 'PKGBUILD'], cwd=PKG_PATH)
+        if not util.prompt(f"Continue installation of {package.name}?"):
+            return False
+
+    procout = subprocess.run(
+        ['makepkg', '-sir'] +
+        (['--needed'] if not force else []) +
+        (['--asdeps'] if dependency else []) +
+        (['--noconfirm'] if settings.autorun else []), cwd=PKG_PATH)
+    pacman.invalidate_cache()
+    if procout.returncode:
+        util.error(f"Failed to install package {package.name}. Cleaning up.")
+
+        try:
+            shutil.rmtree(PKG_PATH)
+        except OSError:
+            util.error(f"Error removing {package.name} build files.")
+
+        return False
+
+    aur.invalidate_cache([package.name])
+
+    try:
+        shutil.rmtree(PKG_PATH)
+    except OSError:
+        util.error(f"Error removing {package.name} build files.")
+
+    return True
+
+
+def install_packages(pkg: str, show_pkgbuild: bool = False, pkginfos: dict[str, dict] | None = None) -> bool:
     '''
     Install a package.
+
+    pkginfos holds the already fetched info of the dependency tree, so dependencies are not requested again.
     '''
-    PKG_PATH = f"{settings.aurman_path}/{pkg}"
+    if pkg in installed_this_session:
+        return True
 
     if pacman.search_pacman(pkg):
-        if dependency:
-            return True
-
         if settings.autorun or util.prompt(f"The package {pkg} is on pacman. Install from there?"):
             procout = subprocess.run([settings.su_program, 'pacman',  '-Su', '--asdeps', '--needed', pkg])
+            pacman.invalidate_cache()
             if procout.returncode != 0:
                 util.error(f"Error installing {pkg} from pacman.")
                 return False
 
+            installed_this_session.add(pkg)
             return True
 
-    pkginfos = aur.get_aur_package_info([pkg])
-    if not pkginfos:
-        util.warning(f"Package {pkg} not found.")
-        if not util.prompt(f"Search {pkg} on AUR?"):
-            raise AURManException(f"Package {pkg} not found.")
+    if pkginfos and pkg in pkginfos:
+        pkginfo = pkginfos[pkg]
+    else:
+        results = aur.get_aur_package_info([pkg]) if aur.package_list_contains(pkg, settings.aurman_path) is not False else []
+        if not results:
+            util.warning(f"Package {pkg} not found.")
+            if not util.prompt(f"Search {pkg} on AUR?"):
+                raise AURManException(f"Package {pkg} not found.")
 
-        pkginfos = aur.get_aur_package_info([search_package(pkg, True)])
+            results = aur.get_aur_package_info([search_package(pkg, True)])
 
-    pkginfo = pkginfos[0]
+        pkginfo = results[0]
+        pkginfos = None
 
     with Spinner():
-        package: Package = Package(pkginfo)
+        dependency_tree = pkginfos or fetch_dependency_tree(pkginfo)
+        package: Package = build_package_graph(pkginfo, dependency_tree)
 
     force: bool = False
-    try:
-        if version.parse(package.version) <= version.parse(ver := pacman.get_package_version(package.name)):
-            if not util.prompt(f"The package {package.name} is already updated. Continue anyway?", default='n'):
-                util.warning(f"Skipping {package.name}: Already installed and updated (version {ver}).")
-                return True
-            force = True
-    except:
-        raise AURManException(f"Invalid version info for package {package.name}.")
+    if is_updated(package.name, package.version):
+        if not util.prompt(f"The package {package.name} is already updated. Continue anyway?", default='n'):
+            util.warning(f"Skipping {package.name}: Already installed and updated (version {pacman.get_package_version(package.name)}).")
+            cancel_prefetch(dependency_tree)
+            installed_this_session.add(package.name)
+            return True
+        force = True
 
     print(package)
     print('')
 
-    if dependency or settings.autorun or util.prompt(f"Continue installation of {package.name}?"):
-        procout = subprocess.run(['rm',  '-rf', PKG_PATH], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Dependencies are installed first, so clone the deepest levels of the tree first
+    prefetch_packages(outdated_packages(package.name, dependency_tree))
 
-        if deps := package.get_aur_deps():
+    if settings.autorun or util.prompt(f"Continue installation of {package.name}?"):
+        if plan := plan_install(package):
             util.info(f"Processing dependencies of {package.name}...")
-            for dep in deps:
-                if not install_packages(dep.name, show_pkgbuild, dependency=True):
-                    return False
+            if not execute_plan(plan, show_pkgbuild):
+                return False
 
-        procout = subprocess.run(['git', 'clone', f"https://aur.archlinux.org/{package.base_package}.git", PKG_PATH])
-        if procout.returncode:
-            util.error(f"Could not clone {package.name} from git.")
-            return False
+        return install_source(package, show_pkgbuild, force=force)
+
+    cancel_prefetch(dependency_tree)
+    return False
+
+
+def is_updated(pkg: str, version: str) -> bool:
+    '''
+    Check if the installed version of a package is the same or newer than the AUR one.
+    '''
+    if not (ver := pacman.get_package_version(pkg)):
+        return False
+
+    try:
+        return ver == version or util.parse_version(version) <= util.parse_version(ver)
+    except Exception:
+        raise AURManException(f"Invalid version info for package {pkg}.")
+
+
+def outdated_packages(pkg: str, pkginfos: dict[str, dict]) -> list[dict]:
+    '''
+    Get the info of a package and of its dependencies which are not installed and updated, deepest first.
+    '''
+    return [info for name, info in reversed(pkginfos.items()) if name == pkg or not is_updated(name, info['Version'])]
+
+
+def install_source(package: Package, show_pkgbuild: bool = False, dependency: bool = False, force: bool = False) -> bool:
+    '''
+    Clone (or wait for the background clone of), build and install a package.
+    '''
+    if not fetch_source(package):
+        util.error(f"Could not clone {package.name} from git.")
+        return False
+
+    new: bool = not pacman.get_package_version(package.name)
+    if not build_source(package, show_pkgbuild, dependency, force):
+        return False
+
+    installed_this_session.add(package.name)
+    if new:
+        new_this_session.add(package.name)
+
+    return True
+
+
+def plan_install(package: Package) -> list[list[Package]]:
+    '''
+    Group the AUR dependencies of a package in install layers.
+
+    Every package only depends on packages of the previous layers, so the layers are installed in order.
+    '''
+    depth: dict[str, int] = {}
+    plan: list[list[Package]] = []
+    for dep in package.get_aur_deps():
+        # get_aur_deps lists every package after its own dependencies, so their depth is already known
+        depth[dep.name] = max((depth[p.name] + 1 for p in dep.aur_dependencies if p.name in depth), default=0)
+        if depth[dep.name] == len(plan):
+            plan.append([])
+
+        plan[depth[dep.name]].append(dep)
+
+    return plan
+
+
+def execute_plan(plan: list[list[Package]], show_pkgbuild: bool = False) -> bool:
+    '''
+    Install the dependency layers of an install plan (see plan_install).
+    '''
+    for layer in plan:
+        for package in layer:
+            if package.name in installed_this_session:
+                continue
+
+            if is_updated(package.name, package.version):
+                cancel_prefetch([package.name])
+                installed_this_session.add(package.name)
+                continue
+
+            print(package)
+            print('')
 
-        if show_pkgbuild:
-            procout = subprocess.run(['less', 'PKGBUILD'], cwd=PKG_PATH)
-            if not util.prompt(f"Continue installation of {package.name}?"):
+            if not install_source(package, show_pkgbuild, dependency=True):
                 return False
 
-        procout = subprocess.run(
-            ['makepkg', '-sir'] +
-            (['--needed'] if not force else []) +
-            (['--asdeps'] if dependency else []) +
-            (['--noconfirm'] if settings.autorun else []), cwd=PKG_PATH)
-        if procout.returncode:
-            util.error(f"Failed to install package {package.name}. Cleaning up.")
+    return True
 
-            procout = subprocess.run(['rm',  '-rf', PKG_PATH])
-            if procout.returncode != 0:
-                util.error(f"Error removing {package.name} build files.")
 
+def install_many(pkgs: list[str], show_pkgbuild: bool = False) -> bool:
+    '''
+    Install packages, cloning all of the AUR ones and their dependencies in background.
+    '''
+    with Spinner():
+        pacman.load_caches()
+        dependency_trees = {pkginfo['Name']: fetch_dependency_tree(pkginfo) for pkginfo in aur.get_aur_package_info([p for p in pkgs if not pacman.search_pacman(p)])}
+
+    for pkg, dependency_tree in dependency_trees.items():
+        prefetch_packages(outdated_packages(pkg, dependency_tree))
+
+    for pkg in pkgs:
+        if not install_packages(pkg, show_pkgbuild=show_pkgbuild, pkginfos=dependency_trees.get(pkg)):
+            discard_prefetch()
             return False
 
-        procout = subprocess.run(['rm',  '-rf', PKG_PATH])
-        if procout.returncode != 0:
-            util.error(f"Error removing {package.name} build files.")
+    needed: set[str] = set(pkgs).union(*(runtime_dependencies(pkg, tree) for pkg, tree in dependency_trees.items()))
+    return remove_build_dependencies([name for name in dict.fromkeys(name for tree in dependency_trees.values() for name in tree)
+                                      if name in new_this_session and name not in needed])
 
+
+def runtime_dependencies(pkg: str, pkginfos: dict[str, dict]) -> set[str]:
+    '''
+    Get the AUR packages needed to run a package: itself and its dependencies, without the make and check ones.
+    '''
+    needed: set[str] = set()
+    stack: list[str] = [pkg]
+    while stack:
+        if (name := stack.pop()) in needed or name not in pkginfos:
+            continue
+
+        needed.add(name)
+        stack.extend(map(util.remove_version_constraint, pkginfos[name].get('Depends', [])))
+
+    return needed
+
+
+def remove_build_dependencies(pkgs: list[str]) -> bool:
+    '''
+    Offer to remove the AUR packages installed by this run only to build others, with a single prompt.
+    '''
+    if not pkgs:
         return True
 
-    return False
+    util.info('The following AUR packages were installed only to build others: ' + ', '.join(pkgs))
+    # The packages were already confirmed here, so pacman does not ask again
+    if (settings.autorun or util.prompt('Remove them?')) and not pacman.remove_packages(pkgs, settings.su_program, noconfirm=True):
+        # Only cleanup, the requested packages are installed anyway
+        util.error('Error removing build dependencies.')
+
+    return True
 
 
 def update_packages():
     '''
     Updates all installed packages.
     '''
-    STEP = 200
-
     aur_packages: list[list[str]] = aur.aur_installed_packages()
     if not aur_packages:
         return False
 
-    packages: list[Package] = []
-    for i in range(0, len(aur_packages) - 1, STEP):
-        pkgs = [x[0] for x in aur_packages[i:i + STEP]]
-        packages += [Package(_, False) for _ in aur.get_aur_package_info(pkgs)]
+    installed_versions: dict[str, str] = dict(aur_packages)
+    # Cached info may predate a new release, and install_many reuses the refreshed info
+    remote_versions: dict[str, str] = {p['Name']: p['Version'] for p in aur.refresh_aur_package_info(list(installed_versions))}
 
-    to_update: list[Package] = [x for x in packages if version.parse(next((_[1] for _ in aur_packages if _[0] == x.name))) < version.parse(x.version)]
+    # Compare the version strings first, so up to date packages are never parsed
+    to_update: list[str] = [name for name, ver in remote_versions.items() if ver != installed_versions[name] and util.parse_version(installed_versions[name]) < util.parse_version(ver)]
     if not to_update:
         util.info('No packages to update.')
         return True
 
-    util.info('The following packages will be updated: ' + ', '.join(map(lambda x: x.name, to_update)))
+    util.info('The following packages will be updated: ' + ', '.join(to_update))
 
-    for package in to_update:
-        if not install_packages(package.name, show_pkgbuild=settings.review_pkgbuild):
-            return False
+    return install_many(to_update, show_pkgbuild=settings.review_pkgbuild)
 
 
 def list_packages():
     '''
     List all AUR installed packages.
     '''
-    STEP = 200
-
     aur_packages: list[list[str]] = aur.aur_installed_packages()
     if not aur_packages:
         return False
 
-    packages: list[Package] = []
-    for i in range(0, len(aur_packages) - 1, STEP):
-        pkgs = [x[0] for x in aur_packages[i:i + STEP]]
-        packages += [Package(_, False) for _ in aur.get_aur_package_info(pkgs)]
+    installed_versions: dict[str, str] = dict(aur_packages)
+    # Cached info may predate a new release
+    remote_versions: dict[str, str] = {p['Name']: p['Version'] for p in aur.refresh_aur_package_info(list(installed_versions))}
+
+    lines: list[str] = [f"{name}: " + util.color_text(ver := installed_versions[name], util.COLORS.white if util.parse_version(ver) >= util.parse_version(remote_ver) else util.COLORS.magenta)
+                        for name, remote_ver in remote_versions.items()]
+    sys.stdout.write(''.join(f"{line}\n" for line in lines))
+
+
+def index_package_list() -> None:
+    '''
+    Write the line offsets of the package list (packages.txt) to packages.idx.
+    '''
+    with open(f"{settings.aurman_path}/packages.txt", 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
 
-    print("\n".join(map(lambda x: f"{x.name}: " + util.color_text(ver := next((_[1] for _ in aur_packages if _[0] == x.name)), util.COLORS.white if (version.parse(ver) >= version.parse(x.version)) else util.COLORS.magenta), packages)))
+    offsets: array = array('I', accumulate((len(line) for line in lines[:-1]), initial=0) if lines else [])
+    with open(f"{settings.aurman_path}/packages.idx", 'wb') as f:
+        offsets.tofile(f)
 
 
 def update_package_cache(cache_version: bool = False) -> bool:
     '''
     Updates the package cache (packages.txt).
     '''
-    STEP = 200
-    if path.exists(f"{settings.aurman_path}/packages.gz"):
-        unlink(f"{settings.aurman_path}/packages.gz")
+    GZ_PATH = f"{settings.aurman_path}/packages.gz"
+
+    # Only download the list again if it changed since the last update
+    headers: dict[str, str] = {}
+    if path.exists(GZ_PATH) and path.exists(f"{settings.aurman_path}/packages.txt"):
+        headers['If-Modified-Since'] = formatdate(stat(GZ_PATH).st_mtime, usegmt=True)
+
+    with aur.get_session().get('https://aur.archlinux.org/packages.gz', headers=headers, stream=True, timeout=aur.TIMEOUT) as res:
+        if res.status_code == 304:
+            if not path.exists(f"{settings.aurman_path}/packages.idx"):
+                index_package_list()
+
+            util.info('Package cache is up to date.')
+            return True
 
-    with open(f"{settings.aurman_path}/packages.gz", 'wb') as f:
-        procout = subprocess.run(['curl', 'https://aur.archlinux.org/packages.gz'], cwd=settings.aurman_path, stdout=f)
-        if procout.returncode != 0:
+        if res.status_code != 200:
             return False
 
-    procout = subprocess.run(['gzip', '-cd', 'packages.gz'], cwd=settings.aurman_path, stdout=subprocess.PIPE)
-    if procout.returncode != 0:
-        return False
+        # Decompress while downloading, the saved file is only used to revalidate the list.
+        # The body is read undecoded: AUR sends the archive with Content-Encoding: gzip, so it is only gunzipped here
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        data: list[bytes] = []
+        try:
+            with open(f"{GZ_PATH}.tmp", 'wb') as f:
+                for chunk in res.raw.stream(65536, decode_content=False):
+                    f.write(chunk)
+                    data.append(decompressor.decompress(chunk))
+
+            data.append(decompressor.flush())
+            if not decompressor.eof:
+                raise zlib.error('truncated archive')
+        except BaseException as e:
+            # Never leave a partial download behind
+            if path.exists(f"{GZ_PATH}.tmp"):
+                remove(f"{GZ_PATH}.tmp")
+
+            if not isinstance(e, zlib.error):
+                raise
+
+            util.error(f"Invalid package list downloaded: {e}")
+            return False
+
+        if last_modified := res.headers.get('Last-Modified'):
+            mtime = parsedate_to_datetime(last_modified).timestamp()
+            utime(f"{GZ_PATH}.tmp", (mtime, mtime))
 
-    packages = procout.stdout.decode().strip().split("\n")[1:]
+        replace(f"{GZ_PATH}.tmp", GZ_PATH)
+
+    packages = [line for line in b''.join(data).split(b'\n') if line and not line.startswith(b'#')]
+
+    # bytes compare faster than str and skip decoding every name
     packages.sort()
 
-    with open(f"{settings.aurman_path}/packages.txt", 'w') as f:
-        for i in range(0, len(packages) - 1, STEP):
-            pkgs = packages[i:i + STEP]
-            if cache_version:
-                pkginfo = aur.get_aur_package_info(pkgs)
-                for pkg in pkginfo:
-                    f.write(f"{pkg['Name']}: {pkg['Version']}\n")
-            else:
-                for pkg in pkgs:
-                    f.write(f"{pkg}\n")
+    # Offset of each line, so the sorted list can be binary searched without loading it
+    offsets: array = array('I')
+    with open(f"{settings.aurman_path}/packages.txt", 'wb') as f:
+        if cache_version:
+            offset = 0
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                for pkginfo in executor.map(aur.request_aur_package_info, util.chunked((p.decode() for p in packages), aur.STEP)):
+                    # Batches are in order, but RPC results are not, and the index needs sorted lines
+                    pkginfo.sort(key=lambda pkg: pkg['Name'].encode())
+                    if not (lines := [f"{pkg['Name']}: {pkg['Version']}\n".encode() for pkg in pkginfo]):
+                        continue
+
+                    offsets.extend(accumulate((len(line) for line in lines[:-1]), initial=offset))
+                    offset += sum(map(len, lines))
+                    f.write(b''.join(lines))
+        else:
+            offsets.extend(accumulate((len(p) + 1 for p in packages[:-1]), initial=0) if packages else [])
+            f.write(b'\n'.join(packages) + b'\n')
+
+    with open(f"{settings.aurman_path}/packages.idx", 'wb') as f:
+        offsets.tofile(f)
 
     return True
 
@@ -326,6 +711,8 @@ def main(args: list[str]) -> int:
 
     parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + __version__)
     parser.add_argument('-i', help='show PKGBUILD before install', action='store_true')
+    parser.add_argument('--parallel', help='how many packages are cloned at the same time (default: CLONE_JOBS)', type=int, metavar='N')
+    parser.add_argument('--no-cache', help='discard cached AUR package info before running', action='store_true')
 
     group = parser.add_argument_group('AUR options')
     exc_group = group.add_mutually_exclusive_group(required=True)
@@ -338,8 +725,17 @@ def main(args: list[str]) -> int:
     exc_group.add_argument('--gpg', help='import the provided GPG keys', nargs='+', metavar='key')
 
     arguments = parser.parse_args()
+    installed_this_session.clear()
+    new_this_session.clear()
+
+    if arguments.parallel:
+        global clone_pool
+        clone_pool = ThreadPoolExecutor(max_workers=max(1, arguments.parallel))
 
     try:
+        if arguments.no_cache:
+            aur.clear_rpc_cache()
+
         if arguments.config:
             if not show_config():
                 return 1
@@ -347,15 +743,13 @@ def main(args: list[str]) -> int:
             if not update_package_cache():
                 return 1
         elif arguments.S:
-            for pkg in arguments.S:
-                if not install_packages(pkg, show_pkgbuild=settings.review_pkgbuild or arguments.i):
-                    return 1
+            if not install_many(arguments.S, show_pkgbuild=settings.review_pkgbuild or arguments.i):
+                return 1
         elif arguments.query:
             list_packages()
         elif arguments.s:
-            for pkg in arguments.s:
-                if not search_package(pkg):
-                    return 1
+            if not search_many(arguments.s):
+                return 1
         elif arguments.upgrade:
             if not update_packages():
                 return 1
@@ -369,6 +763,9 @@ def main(args: list[str]) -> int:
         pass
     except Exception as e:
         logging.exception(e, exc_info=True, stack_info=True, extra={'prog': 'aurman'})
+    finally:
+        # Otherwise the interpreter only exits after every queued clone ran
+        discard_prefetch()
 
     return 0
 
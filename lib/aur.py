@@ -14,28 +14,320 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import requests
+from array import array
+from contextlib import closing
+from functools import lru_cache
+import json
+import logging
+import mmap
+from os import makedirs, path
+import sqlite3
 import subprocess
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Iterator, Optional
+from urllib.parse import urlencode
 
-from aurman import AURManException
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads  # type: ignore[assignment]
+
+from lib.util import AURManException, __version__, chunked
+
+if TYPE_CHECKING:
+    import requests
+
+
+STEP = 150
+'''
+Max number of packages per info request
+'''
+
+MAX_URL_LENGTH = 4443
+'''
+Max length of a request URI accepted by AUR
+'''
+
+INFO_URL = 'https://aur.archlinux.org/rpc?v=5&type=info'
+
+TIMEOUT = (5, 30)
+'''
+Connect and read timeouts (in seconds) of AUR requests
+'''
+
+SESSION: Optional['requests.Session'] = None
+'''
+Shared HTTP session, keeps the connection to AUR alive between requests (see get_session)
+'''
+_session_lock: threading.Lock = threading.Lock()
+
+info_cache: dict[str, dict] = {}
+'''
+Package info already fetched by this process
+'''
+
+cache_path: str = ''
+'''
+Where to store the RPC cache (disabled if empty)
+'''
+
+cache_ttl: int = 3600
+'''
+How long (in seconds) a cached package info is valid
+'''
+
+
+def get_session() -> 'requests.Session':
+    '''
+    Get the shared HTTP session, creating it on first use.
+
+    requests is only imported here, so commands which do not reach AUR do not pay for it.
+    '''
+    global SESSION
+
+    with _session_lock:
+        if SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            # Throttled or failed requests are retried with exponential backoff, honouring Retry-After
+            retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                          respect_retry_after_header=True, raise_on_status=False)
+            SESSION = requests.Session()
+            SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+            SESSION.headers['Accept-Encoding'] = 'gzip'
+            SESSION.headers['User-Agent'] = f"aurman/{__version__}"
+
+    return SESSION
+
+
+def get(url: str) -> 'requests.Response':
+    '''
+    Request an AUR URL through the shared session.
+    '''
+    res = get_session().get(url, timeout=TIMEOUT)
+    if 'X-RateLimit-Remaining' in res.headers:
+        logging.debug(f"AUR rate limit remaining: {res.headers['X-RateLimit-Remaining']}")
+
+    return res
+
+
+def init_cache(file: str, ttl: int) -> None:
+    '''
+    Enable the on-disk cache of AUR package info.
+    '''
+    global cache_path, cache_ttl
+
+    try:
+        makedirs(path.dirname(file), exist_ok=True)
+        with closing(sqlite3.connect(file)) as db, db:
+            db.execute('CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, json TEXT NOT NULL, fetched_at INTEGER NOT NULL)')
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Could not open RPC cache {file}: {e}")
+        return
+
+    cache_path = file
+    cache_ttl = ttl
+
+
+def read_cache(pkg: list[str]) -> dict[str, dict]:
+    '''
+    Get the cached package info which has not expired yet.
+    '''
+    if not cache_path or not pkg or cache_ttl <= 0:
+        return {}
+
+    pkginfos: dict[str, dict] = {}
+    with closing(sqlite3.connect(cache_path)) as db:
+        for chunk in chunked(pkg, STEP):
+            rows = db.execute(f"SELECT name, json FROM info WHERE fetched_at > ? AND name IN ({', '.join('?' * len(chunk))})",
+                              [int(time.time()) - cache_ttl, *chunk])
+            pkginfos.update({name: json_loads(info) for name, info in rows})
+
+    return pkginfos
+
+
+def write_cache(pkginfos: list[dict]) -> None:
+    '''
+    Store package info in the cache.
+    '''
+    if not cache_path or not pkginfos:
+        return
+
+    now = int(time.time())
+    with closing(sqlite3.connect(cache_path)) as db, db:
+        db.executemany('INSERT OR REPLACE INTO info (name, json, fetched_at) VALUES (?, ?, ?)',
+                       [(p['Name'], json.dumps(p), now) for p in pkginfos])
+
+
+def invalidate_cache(pkg: list[str]) -> None:
+    '''
+    Remove packages from the cache.
+    '''
+    for p in pkg:
+        info_cache.pop(p, None)
+
+    if not cache_path or not pkg:
+        return
+
+    with closing(sqlite3.connect(cache_path)) as db, db:
+        db.executemany('DELETE FROM info WHERE name = ?', [(p,) for p in pkg])
+
+
+def clear_rpc_cache() -> None:
+    '''
+    Remove all package info from the cache.
+    '''
+    info_cache.clear()
+
+    if not cache_path:
+        return
+
+    with closing(sqlite3.connect(cache_path)) as db, db:
+        db.execute('DELETE FROM info')
 
 
 def get_aur_package_info(pkg: list[str]) -> list:
     '''
     Get package info (name, version, ...) from AUR using RPC interface.
+
+    Info already fetched by this process or cached on disk is used when available, the other packages are requested in one batch.
+    '''
+    pkginfos = {p: info_cache[p] for p in pkg if p in info_cache}
+    if missing := [p for p in pkg if p not in pkginfos]:
+        pkginfos.update(read_cache(missing))
+
+    if missing := [p for p in missing if p not in pkginfos]:
+        results = request_aur_package_info(missing)
+        write_cache(results)
+        pkginfos.update({p['Name']: p for p in results})
+
+    info_cache.update(pkginfos)
+    return [pkginfos[p] for p in pkg if p in pkginfos]
+
+
+def refresh_aur_package_info(pkg: list[str]) -> list:
+    '''
+    Get package info from AUR bypassing the caches, then store it in them.
+    '''
+    results = request_aur_package_info(pkg)
+    write_cache(results)
+    info_cache.update({p['Name']: p for p in results})
+    return results
+
+
+def split_request(pkg: list[str]) -> Iterator[str]:
+    '''
+    Split packages into info request URLs of at most STEP packages and MAX_URL_LENGTH characters.
+    '''
+    url, count = INFO_URL, 0
+    for arg in ('&' + urlencode([('arg[]', p)]) for p in pkg):
+        if count and (count == STEP or len(url) + len(arg) > MAX_URL_LENGTH):
+            yield url
+            url, count = INFO_URL, 0
+
+        url += arg
+        count += 1
+
+    if count:
+        yield url
+
+
+def request_aur_package_info(pkg: list[str]) -> list:
+    '''
+    Request package info from AUR RPC interface.
+
+    Packages are requested in batches, one request per batch (see split_request).
+    '''
+    results: list = []
+    for url in split_request(pkg):
+        res = get(url)
+        if res.status_code != 200:
+            raise AURManException('Could not connect to AUR.')
+
+        result = json_loads(res.content)
+        if result['resultcount']:
+            results += result['results']
+
+    return results
+
+
+def search_aur_packages(q: str) -> list:
+    '''
+    Search packages (by name and description) on AUR using RPC interface.
     '''
-    res = requests.get('https://aur.archlinux.org/rpc?v=5&type=info' + ''.join([f'&arg[]={p}' for p in pkg]))
+    res = get(f"https://aur.archlinux.org/rpc?v=5&type=search&arg={q}")
     if res.status_code != 200:
         raise AURManException('Could not connect to AUR.')
 
-    result = res.json()
-
-    if result['resultcount'] == 0:
+    result = json_loads(res.content)
+    if not result['resultcount']:
         return []
 
     return result['results']
 
 
+@lru_cache(maxsize=None)
+def load_package_list(directory: str) -> frozenset[str]:
+    '''
+    Load the names of the AUR package list (packages.txt).
+    '''
+    with open(f"{directory}/packages.txt", 'rb') as f:
+        return frozenset(line.split(b': ', 1)[0].decode() for line in f.read().splitlines())
+
+
+def local_search(q: str, directory: str, max_age: int = 86400) -> Optional[list[str]]:
+    '''
+    Search package names in the AUR package list (packages.txt).
+
+    Returns None if there is no package list or if it is older than max_age seconds.
+    '''
+    try:
+        if time.time() - path.getmtime(f"{directory}/packages.txt") > max_age:
+            return None
+
+        return [name for name in load_package_list(directory) if q in name]
+    except OSError:
+        return None
+
+
+def package_list_contains(pkg: str, directory: str, max_age: int = 86400) -> Optional[bool]:
+    '''
+    Check if a package is in the AUR package list (packages.txt) without loading it.
+
+    The sorted list is binary searched through its line offsets (packages.idx).
+    Returns None if there is no package list or if it is older than max_age seconds.
+    '''
+    ITEMSIZE = array('I').itemsize
+
+    try:
+        if time.time() - path.getmtime(f"{directory}/packages.txt") > max_age:
+            return None
+
+        with open(f"{directory}/packages.txt", 'rb') as f, open(f"{directory}/packages.idx", 'rb') as fi, \
+                mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ) as data, mmap.mmap(fi.fileno(), 0, prot=mmap.PROT_READ) as idx:
+            key = pkg.encode()
+            lo, hi = 0, len(idx) // ITEMSIZE
+            while lo < hi:
+                mid = (lo + hi) // 2
+                start = int.from_bytes(idx[mid * ITEMSIZE:(mid + 1) * ITEMSIZE], sys.byteorder)
+                end = data.find(b'\n', start)
+                name = data[start:end if end != -1 else len(data)].split(b': ', 1)[0]
+                if name < key:
+                    lo = mid + 1
+                elif name > key:
+                    hi = mid
+                else:
+                    return True
+    except (OSError, ValueError):
+        return None
+
+    return False
+
+
 def aur_installed_packages() -> list[list[str]]:
     '''
     List all installed packages from AUR and the installed version.
@@ -44,8 +336,8 @@ def aur_installed_packages() -> list[list[str]]:
 
     [1] = installed version
     '''
-    out = subprocess.run(['pacman', '-Qm'], stdout=subprocess.PIPE)
+    out = subprocess.run(['pacman', '-Qm'], stdout=subprocess.PIPE, text=True)
     if out.returncode != 0:
         return []
 
-    return list(map(lambda x: x.split(' '), out.stdout.decode().strip().split("\n")))
+    return [line.split(' ', 1) for line in out.stdout.splitlines()]
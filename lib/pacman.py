@@ -14,26 +14,98 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from os import scandir
 import subprocess
+from typing import Optional
+
+
+LOCAL_DB = '/var/lib/pacman/local'
+'''
+pacman local database, one name-version-release directory per installed package
+'''
+
+_installed_packages: Optional[dict[str, str]] = None
+'''
+Installed packages and their versions
+'''
+
+
+def read_local_db() -> Optional[dict[str, str]]:
+    '''
+    Get all installed packages and their versions from the pacman local database directory names.
+
+    Returns None if the database could not be read.
+    '''
+    try:
+        with scandir(LOCAL_DB) as entries:
+            names = [entry.name.rsplit('-', 2) for entry in entries if entry.is_dir()]
+    except OSError:
+        return None
+
+    return {name[0]: f"{name[1]}-{name[2]}" for name in names if len(name) == 3}
+
+
+def installed_packages_cache() -> dict[str, str]:
+    '''
+    Get all installed packages and their versions, reading the pacman database only once.
+
+    Falls back to pacman -Q if the local database could not be read.
+    '''
+    global _installed_packages
+
+    if _installed_packages is None:
+        _installed_packages = read_local_db()
+
+    if _installed_packages is None:
+        procout = subprocess.run(['pacman', '-Q'], stdout=subprocess.PIPE)
+        _installed_packages = dict(line.split(' ', 1) for line in procout.stdout.decode().splitlines()) if procout.returncode == 0 else {}
+
+    return _installed_packages
+
+
+@lru_cache(maxsize=None)
+def repo_packages_cache() -> frozenset[str]:
+    '''
+    Get all packages available on the sync repositories, querying pacman only once.
+
+    The sync databases are never refreshed by aurman, so this is not invalidated after installs.
+    '''
+    procout = subprocess.run(['pacman', '-Slq'], stdout=subprocess.PIPE)
+    return frozenset(procout.stdout.decode().splitlines()) if procout.returncode == 0 else frozenset()
+
+
+def load_caches() -> None:
+    '''
+    Load the installed and the sync repository packages at the same time.
+    '''
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        executor.submit(installed_packages_cache)
+        executor.submit(repo_packages_cache)
+
+
+def invalidate_cache() -> None:
+    '''
+    Discard the cached installed packages, so they are queried again after packages are installed.
+    '''
+    global _installed_packages
+
+    _installed_packages = None
 
 
 def search_pacman(pkg: str) -> bool:
     '''
     Search a package in the pacman database.
     '''
-    procout = subprocess.run(['pacman', '-Ss', f'^{pkg}$'], stdout=subprocess.DEVNULL)
-    return procout.returncode == 0
+    return pkg in repo_packages_cache()
 
 
 def get_package_version(pkg: str) -> str:
     '''
     Get the package version from the pacman database.
     '''
-    procout = subprocess.run(['pacman', '-Qs', f'^{pkg}$'], stdout=subprocess.PIPE)
-    if procout.returncode != 0:
-        return ''
-
-    return procout.stdout.decode().split(' ')[1].strip()
+    return installed_packages_cache().get(pkg, '')
 
 
 def remove_package(pkg: str, SU_PROGRAM: str = 'sudo') -> bool:
@@ -42,3 +114,15 @@ def remove_package(pkg: str, SU_PROGRAM: str = 'sudo') -> bool:
     '''
     procout = subprocess.run([SU_PROGRAM, 'pacman', '-R', pkg])
     return procout.returncode == 0
+
+
+def remove_packages(pkgs: list[str], SU_PROGRAM: str = 'sudo', noconfirm: bool = False) -> bool:
+    '''
+    Uninstall packages (and their unneeded dependencies) from the system in a single transaction.
+    '''
+    if not pkgs:
+        return True
+
+    procout = subprocess.run([SU_PROGRAM, 'pacman', '-Rns'] + (['--noconfirm'] if noconfirm else []) + pkgs)
+    invalidate_cache()
+    return procout.returncode == 0
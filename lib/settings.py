@@ -14,9 +14,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from __future__ import annotations
 from configparser import ConfigParser
 
 
+_cached: dict[str, Settings] = {}
+'''
+Settings already loaded, by file
+'''
+
+
+def invalidate_settings_cache() -> None:
+    '''
+    Discard the loaded settings, so the files are read again.
+    '''
+    _cached.clear()
+
+
 class Settings:
     '''
     Settings wrapper
@@ -52,17 +66,45 @@ class Settings:
     Always review PKGBUILD
     '''
 
-    def __init__(self, FILE: str = '/etc/aurman.conf') -> None:
+    clone_jobs: int = 4
+    '''
+    How many packages are cloned at the same time
+    '''
+
+    cache_ttl: int = 3600
+    '''
+    How long (in seconds) AUR package info is cached
+    '''
+
+    def __new__(cls, FILE: str = '/etc/aurman.conf') -> Settings:
+        if FILE not in _cached:
+            settings = super().__new__(cls)
+            settings.load(FILE)
+            _cached[FILE] = settings
+
+        return _cached[FILE]
+
+    def load(self, FILE: str) -> None:
+        '''
+        Read the settings from an INI file.
+        '''
+        self.config = ConfigParser()
         self.config.read(FILE)
         self.su_program = self.config.get('General', 'SU_PROGRAM', fallback='sudo')
         self.autorun = self.config.getboolean('General', 'AUTORUN', fallback=False)
         self.aurman_path = self.config.get('General', 'AURMAN_PATH', fallback='/tmp/aurman')
         self.log_path = self.config.get('General', 'LOG_PATH', fallback='/tmp/aurman.log')
+        self.cache_ttl = self.config.getint('General', 'CACHE_TTL', fallback=3600)
         self.review_pkgbuild = self.config.getboolean('Install', 'REVIEW_PKGBUILD', fallback=False)
+        self.clone_jobs = max(1, self.config.getint('Install', 'CLONE_JOBS', fallback=4))
 
     def __repr__(self) -> str:
         return f"[General]\n"\
             f"  SU Program: {self.su_program}\n"\
             f"  Autorun: {self.autorun}\n"\
             f"  AURMan path: {self.aurman_path}\n"\
-            f"  Log path: {self.log_path}"
+            f"  Log path: {self.log_path}\n"\
+            f"  Cache TTL: {self.cache_ttl}\n"\
+            f"[Install]\n"\
+            f"  Review PKGBUILD: {self.review_pkgbuild}\n"\
+            f"  Clone jobs: {self.clone_jobs}"
@@ -20,58 +20,41 @@
 import sys
 import threading
 import itertools
-import time
-from typing import Iterable
+from typing import Iterator, Optional
 
 
 class Spinner:
-    spinner: Iterable[str]
-    delat: float
-    busy: bool
-    visible: bool
-    _screen_lock: threading.Lock
-    thread: threading.Thread
+    spinner: Iterator[str]
+    delay: float
+    stopped: threading.Event
+    thread: Optional[threading.Thread]
 
     def __init__(self, message: str = '', delay: float = 0.1):
         self.spinner = itertools.cycle(['-', '\\', '|', '/'])
         self.delay = delay
-        self.busy = False
-        self.visible = False
+        self.stopped = threading.Event()
+        self.thread = None
         sys.stdout.write(message)
 
-    def write_next(self):
-        with self._screen_lock:
-            if not self.visible:
-                sys.stdout.write(next(self.spinner))
-                self.visible = True
-                sys.stdout.flush()
-
-    def remove_spinner(self, cleanup: bool = False):
-        with self._screen_lock:
-            if self.visible:
-                sys.stdout.write('\b')
-                self.visible = False
-                if cleanup:
-                    sys.stdout.write(' ')       # overwrite spinner with blank
-                    sys.stdout.write('\r')      # move to next line
-                sys.stdout.flush()
-
     def spinner_task(self):
-        while self.busy:
-            self.write_next()
-            time.sleep(self.delay)
-            self.remove_spinner()
+        # Only this thread draws while the spinner is running, so each tick is a single write
+        sys.stdout.write(next(self.spinner))
+        sys.stdout.flush()
+        while not self.stopped.wait(self.delay):
+            sys.stdout.write('\b' + next(self.spinner))
+            sys.stdout.flush()
 
     def __enter__(self):
         if sys.stdout.isatty():
-            self._screen_lock = threading.Lock()
-            self.busy = True
             self.thread = threading.Thread(target=self.spinner_task)
             self.thread.start()
 
     def __exit__(self, exception, value, tb):
-        if sys.stdout.isatty():
-            self.busy = False
-            self.remove_spinner(cleanup=True)
+        if self.thread:
+            self.stopped.set()
+            self.thread.join()
+            sys.stdout.write('\b \r')     # overwrite spinner with blank
         else:
             sys.stdout.write('\r')
+
+        sys.stdout.flush()
@@ -14,10 +14,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
+from functools import lru_cache
+from itertools import islice
 import sys
+from typing import TYPE_CHECKING, Iterable, Iterator, TypeVar
 from lib import pacman
 
+if TYPE_CHECKING:
+    from packaging.version import Version
+
+
+T = TypeVar('T')
+
 
 __version__ = '0.0.1'
 
@@ -55,8 +63,29 @@ def remove_version_constraint(pkg):
     '''
     Remove version constraint from package name.
     '''
-    match = re.search('^[^<>=!]*', pkg)
-    return match.group() if match else ''
+    if not any(c in pkg for c in '<>=!'):
+        return pkg
+
+    return pkg[:min(i for i in map(pkg.find, '<>=!') if i != -1)]
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    '''
+    Split an iterable into lists of at most size items.
+    '''
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+@lru_cache(maxsize=None)
+def parse_version(ver: str) -> 'Version':
+    '''
+    Parse a version string, reusing the result for versions already parsed.
+    '''
+    from packaging import version
+
+    return version.parse(ver)
 
 
 def color_text(text: str, color: int):